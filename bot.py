@@ -1,17 +1,21 @@
 
 from __future__ import annotations
+import asyncio
 import os
 import json
+import logging
+import logging.handlers
+import queue
 import random
 import sqlite3
-import textwrap
-from dataclasses import dataclass
-from datetime import datetime, time, timezone
-from typing import List, Dict, Any, Optional, Tuple
-
-import pytz
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta, timezone
+from time import time as epoch_seconds
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from zoneinfo import ZoneInfo
+
 from telegram import (
     Update,
     InlineKeyboardMarkup,
@@ -26,6 +30,8 @@ from telegram.ext import (
     ContextTypes,
 )
 
+from questions import Question, QUESTIONS, QUESTIONS_BY_ID
+
 # =============================
 # Config
 # =============================
@@ -43,208 +49,28 @@ WEBAPP_HOST = os.environ.get("WEBAPP_HOST", "0.0.0.0")
 WEBAPP_PORT = int(os.environ.get("WEBAPP_PORT", "8443"))
 
 # =============================
-# Sample Questions
+# Logging
 # =============================
-# You can extend/replace this list from a JSON or API. Each item must have:
-# id, category in {"SQL","Algorithms","HTML"}, question, solution (markdown), difficulty
-QUESTIONS: List[Dict[str, Any]] = [
-    {
-        "id": "sql-join-null-1",
-        "category": "SQL",
-        "difficulty": "easy",
-        "question": textwrap.dedent(
-            """
-            **SQL — INNER vs LEFT JOIN**
-            Given tables `orders(order_id, customer_id)` and `customers(customer_id, name)`,
-            write a query that returns *all customers* and the number of orders they placed
-            (0 if none). Sort by `name`.
-            """
-        ).strip(),
-        "solution": textwrap.dedent(
-            """
-            ```sql
-            SELECT c.customer_id,
-                   c.name,
-                   COUNT(o.order_id) AS order_count
-            FROM customers AS c
-            LEFT JOIN orders AS o
-              ON o.customer_id = c.customer_id
-            GROUP BY c.customer_id, c.name
-            ORDER BY c.name;
-            ```
-
-            **Why this works**
-            - `LEFT JOIN` preserves every row from `customers`, attaching matching `orders` rows when they exist.
-            - `COUNT(o.order_id)` counts only non-NULL `order_id`, so customers with no orders get 0.
-            - Grouping by the customer keys yields a single row per customer.
-            """
-        ).strip(),
-    },
-    {
-        "id": "algo-two-sum-2",
-        "category": "Algorithms",
-        "difficulty": "easy",
-        "question": textwrap.dedent(
-            """
-            **Algorithms — Two Sum (Hash Map)**
-            Given an integer array `nums` and an integer `target`, return indices of the two
-            numbers that add up to `target`. Assume exactly one solution and no reuse.
-            What is the \*O(n)\* approach?
-            """
-        ).strip(),
-        "solution": textwrap.dedent(
-            """
-            Use a running hash map from value → index.
-            ```python
-            def two_sum(nums, target):
-                seen = {}
-                for i, x in enumerate(nums):
-                    if target - x in seen:
-                        return [seen[target - x], i]
-                    seen[x] = i
-            ```
-            **Why O(n)**: each element is inserted/checked once; dict ops are amortized O(1).
-            """
-        ).strip(),
-    },
-    {
-        "id": "html-semantics-1",
-        "category": "HTML",
-        "difficulty": "easy",
-        "question": textwrap.dedent(
-            """
-            **HTML — Semantic Tags**
-            Replace generic `<div>`s with semantic HTML for: page header with a logo, a nav bar,
-            the main content with an article, and a footer. Give a minimal snippet.
-            """
-        ).strip(),
-        "solution": textwrap.dedent(
-            """
-            ```html
-            <header>
-              <img src="/logo.svg" alt="Site logo" />
-            </header>
-            <nav>
-              <a href="/">Home</a>
-              <a href="/about">About</a>
-            </nav>
-            <main>
-              <article>
-                <h1>Title</h1>
-                <p>Body…</p>
-              </article>
-            </main>
-            <footer>© 2025</footer>
-            ```
-            **Why semantic?** Better accessibility, SEO, and default landmark roles.
-            """
-        ).strip(),
-    },
-    {
-        "id": "sql-window-avg-1",
-        "category": "SQL",
-        "difficulty": "medium",
-        "question": textwrap.dedent(
-            """
-            **SQL — Moving Average**
-            For table `prices(day DATE, symbol TEXT, close NUMERIC)`, compute a 3-day moving
-            average of `close` per symbol, ordered by day, returning `day, symbol, ma3`.
-            """
-        ).strip(),
-        "solution": textwrap.dedent(
-            """
-            ```sql
-            SELECT day,
-                   symbol,
-                   AVG(close) OVER (
-                     PARTITION BY symbol
-                     ORDER BY day
-                     ROWS BETWEEN 2 PRECEDING AND CURRENT ROW
-                   ) AS ma3
-            FROM prices;
-            ```
-            **Why window functions?** They avoid self-joins and let you aggregate over a moving frame.
-            """
-        ).strip(),
-    },
-    {
-        "id": "algo-bfs-1",
-        "category": "Algorithms",
-        "difficulty": "medium",
-        "question": textwrap.dedent(
-            """
-            **Algorithms — Shortest Path in Unweighted Graph**
-            Describe how to find the shortest path length from a source `s` to all nodes in
-            an unweighted graph with adjacency list `G`.
-            """
-        ).strip(),
-        "solution": textwrap.dedent(
-            """
-            Breadth-First Search (BFS) from `s` keeps a queue and `dist` map.
-            ```python
-            from collections import deque
-
-            def shortest_paths_unweighted(G, s):
-                dist = {s: 0}
-                q = deque([s])
-                while q:
-                    u = q.popleft()
-                    for v in G[u]:
-                        if v not in dist:
-                            dist[v] = dist[u] + 1
-                            q.append(v)
-                return dist
-            ```
-            **Why it works**: BFS explores by layers, ensuring the first time you visit a node
-            is via the fewest edges.
-            """
-        ).strip(),
-    },
-    
-    {
-        "id": 101,
-        "category": "Python",
-        "difficulty": "easy",
-        "question": "מה ההבדל בין רשימה (list) לבין טופל (tuple) בפייתון?",
-        "solution": "list היא mutable (אפשר לשנות ערכים), בעוד tuple היא immutable (לא ניתן לשנות אחרי יצירה)."
-    },
-    {
-        "id": 102,
-        "category": "Python",
-        "difficulty": "medium",
-        "question": "כתוב פונקציה שמקבלת מחרוזת ומחזירה את ספירת המילים בה.",
-        "solution": "אפשר להשתמש ב־split() כדי לחלק למילים ואז לקחת len:\n\n```python\ndef word_count(s):\n    return len(s.split())\n```"
-    },
-    {
-        "id": 103,
-        "category": "Python",
-        "difficulty": "hard",
-        "question": "הסבר מה זה list comprehension ותן דוגמה.",
-        "solution": "syntactic sugar ליצירת רשימות:\n```python\nsquares = [x*x for x in range(5)]\n```"
-    },
-    {
-        "id": 201,
-        "category": "CSS",
-        "difficulty": "easy",
-        "question": "מה ההבדל בין class selector (`.class`) ל־id selector (`#id`) ב־CSS?",
-        "solution": "class יכול להיות בשימוש על מספר אלמנטים, id ייחודי לדף. הסינטקס: `.myclass {}` מול `#myid {}`."
-    },
-    {
-        "id": 202,
-        "category": "CSS",
-        "difficulty": "medium",
-        "question": "איך מגדירים grid layout בסיסי של 3 עמודות ב־CSS?",
-        "solution": "```css\n.container {\n  display: grid;\n  grid-template-columns: 1fr 1fr 1fr;\n}\n```"
-    },
-    {
-        "id": 203,
-        "category": "CSS",
-        "difficulty": "hard",
-        "question": "מה זה CSS specificity ואיך נקבע איזה כלל מנצח?",
-        "solution": "Specificity נקבע לפי סוג selector: inline > id > class > element. כלל עם ניקוד גבוה יותר מנצח."
-    },
-
-]
+logger = logging.getLogger("bot")
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    # Handlers only enqueue records; a background thread does the actual
+    # stream writes, so logging never blocks the event loop.
+    # Installed on the root logger so python-telegram-bot's own records take
+    # the same path.
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    # httpx logs every Bot API request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, stream)
+    listener.start()
+    return listener
 
 # =============================
 # Persistence Layer (SQLite)
@@ -259,15 +85,118 @@ CREATE TABLE IF NOT EXISTS users (
 );
 """
 
+# Statements are kept as constants so the shared connection's statement cache
+# always sees the exact same SQL text and reuses the prepared statement.
+SQL_UPSERT_USER = "INSERT OR IGNORE INTO users (user_id, chat_id, subscribed) VALUES (?,?,1)"
+SQL_SET_SUB = "UPDATE users SET subscribed=? WHERE user_id=?"
+SQL_SET_COUNT = "UPDATE users SET daily_count=? WHERE user_id=?"
+SQL_GET_USER = (
+    "SELECT user_id, chat_id, subscribed, last_question_id, last_sent_date, daily_count "
+    "FROM users WHERE user_id=?"
+)
+SQL_DUE_SUBSCRIBERS = (
+    "SELECT user_id, chat_id, last_question_id, last_sent_date, daily_count "
+    "FROM users WHERE subscribed=1 AND (last_sent_date IS NULL OR last_sent_date != ?)"
+)
+SQL_SET_LAST_SENT = "UPDATE users SET last_question_id=?, last_sent_date=? WHERE user_id=?"
+
+
+_CONN: Optional[sqlite3.Connection] = None
+_DB_CLOSED = False
+
+
+_DB_LOCK = threading.Lock()
+
 
 def db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    return conn
+    # One long-lived connection for the whole process: keeps SQLite's page cache
+    # warm and avoids reopening the db/-wal/-shm files on every handler call.
+    # Autocommit (isolation_level=None): single statements commit on their own,
+    # multi-statement writes go through transaction().
+    # The connection is used from worker threads, so hold _DB_LOCK around it.
+    global _CONN
+    if _DB_CLOSED:
+        # A late job after shutdown must not silently reopen the database
+        raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+    if _CONN is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA temp_store=MEMORY;")
+        conn.execute("PRAGMA mmap_size=134217728;")  # 128 MiB
+        conn.execute("PRAGMA cache_size=-64000;")  # ~64 MB page cache
+        conn.execute("PRAGMA busy_timeout=5000;")
+        conn.execute("PRAGMA wal_autocheckpoint=1000;")
+        _CONN = conn
+    return _CONN
+
+
+def close_db() -> None:
+    # Closing the last connection checkpoints the WAL back into the main file
+    global _CONN, _DB_CLOSED
+    with _DB_LOCK:
+        _DB_CLOSED = True
+        if _CONN is not None:
+            _CONN.close()
+            _CONN = None
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        # SQLite may already have rolled back (e.g. SQLITE_FULL); a second
+        # ROLLBACK would raise and mask the original error.
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+# sqlite3 calls block (fsync on commit), so handlers run them in a worker
+# thread via asyncio.to_thread and the event loop keeps serving updates.
+def _db_fetchone(sql: str, params: Any) -> Optional[sqlite3.Row]:
+    with _DB_LOCK:
+        return db().execute(sql, params).fetchone()
+
+
+def _db_fetchall(sql: str, params: Any) -> List[sqlite3.Row]:
+    with _DB_LOCK:
+        return db().execute(sql, params).fetchall()
+
+
+def _db_execute(sql: str, params: Any) -> None:
+    with _DB_LOCK:
+        db().execute(sql, params)
+
+
+def _db_executemany(sql: str, seq: Any) -> None:
+    with _DB_LOCK, transaction(db()) as conn:
+        conn.executemany(sql, seq)
+
+
+async def db_fetchone(sql: str, params: Any = ()) -> Optional[sqlite3.Row]:
+    return await asyncio.to_thread(_db_fetchone, sql, params)
+
+
+async def db_fetchall(sql: str, params: Any = ()) -> List[sqlite3.Row]:
+    return await asyncio.to_thread(_db_fetchall, sql, params)
+
+
+async def db_execute(sql: str, params: Any = ()) -> None:
+    await asyncio.to_thread(_db_execute, sql, params)
+
+
+async def db_executemany(sql: str, seq: Any) -> None:
+    # All rows in one transaction
+    await asyncio.to_thread(_db_executemany, sql, seq)
 
 
 def init_db():
-    with db() as conn:
+    with _DB_LOCK, transaction(db()) as conn:
         conn.execute(
             """CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER PRIMARY KEY,
@@ -277,30 +206,117 @@ def init_db():
                 last_sent_date TEXT
             )"""
         )
-        conn.commit()
 
         # הוספת העמודה daily_count אם היא לא קיימת
-        try:
+        cols = {r["name"] for r in conn.execute("PRAGMA table_info(users)").fetchall()}
+        if "daily_count" not in cols:
             conn.execute("ALTER TABLE users ADD COLUMN daily_count INTEGER NOT NULL DEFAULT 1;")
-            conn.commit()
-        except Exception:
-            pass  # אם העמודה כבר קיימת – מתעלמים
+        # One-shot backfill so reads can use daily_count as-is (no COALESCE)
+        conn.execute("UPDATE users SET daily_count=1 WHERE daily_count IS NULL;")
 
+        # Partial index: the broadcast SELECT only walks subscribed users
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_subscribed "
+            "ON users(subscribed) WHERE subscribed=1;"
+        )
 
 
 # =============================
 # Question selection helpers
 # =============================
-TZ = pytz.timezone(TIMEZONE)
+TZ = ZoneInfo(TIMEZONE)
+
+
+# The date string only changes at local midnight: cache it until then.
+# Expiry is compared against wall-clock epoch seconds (not monotonic, which
+# stops during suspend and ignores NTP steps) so a stale date can't survive.
+_TODAY_CACHE: Tuple[str, float] = ("", float("-inf"))
 
 
 def today_str() -> str:
-    return datetime.now(TZ).strftime("%Y-%m-%d")
+    global _TODAY_CACHE
+    if epoch_seconds() >= _TODAY_CACHE[1]:
+        now = datetime.now(TZ)
+        midnight = datetime.combine(now.date() + timedelta(days=1), time(), tzinfo=TZ)
+        _TODAY_CACHE = (now.date().isoformat(), midnight.timestamp())
+    return _TODAY_CACHE[0]
+
+
+_RNG = random.Random()
+
+
+# Rejection sampling normally needs one or two draws; the cap only matters
+# for degenerate banks where (almost) every question has the excluded id.
+_MAX_DRAWS = 8
+
+
+def pick_question(previous_id: Optional[Any]) -> Question:
+    # Rejection sampling on a module-local RNG: no allocation, and at most a
+    # couple of draws while there is more than one question.
+    # last_question_id may come back from SQLite as an int, hence the str().
+    if len(QUESTIONS) <= 1:
+        return QUESTIONS[0]
+    prev = None if previous_id is None else str(previous_id)
+    for _ in range(_MAX_DRAWS):
+        q = QUESTIONS[_RNG.randrange(len(QUESTIONS))]
+        if q.id != prev:
+            return q
+    # Fall back to a linear pick; if nothing differs, any question will do
+    for q in QUESTIONS:
+        if q.id != prev:
+            return q
+    return QUESTIONS[0]
+
+
+def pick_questions(previous_id: Optional[Any], n: int) -> List[Question]:
+    # One draw of n distinct questions (none equal to previous_id) instead of
+    # n independent picks, so a batch never repeats a question.
+    prev = None if previous_id is None else str(previous_id)
+    k = min(n + 1, len(QUESTIONS))
+    idxs = _RNG.sample(range(len(QUESTIONS)), k)
+    picks: List[Question] = []
+    for i in idxs:
+        q = QUESTIONS[i]
+        if q.id != prev:
+            picks.append(q)
+            if len(picks) == n:
+                break
+    # Bank smaller than the batch: top up, allowing repeats
+    while len(picks) < n:
+        picks.append(pick_question(picks[-1].id if picks else prev))
+    return picks
 
 
-def pick_question(previous_id: Optional[str]) -> Dict[str, Any]:
-    pool = [q for q in QUESTIONS if q["id"] != previous_id] or QUESTIONS
-    return random.choice(pool)
+# =============================
+# Rate limiting
+# =============================
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Telegram allows ~30 messages/s per bot; pacing sends here avoids 429
+# flood-wait backoffs during the broadcast.
+GLOBAL_BUCKET = TokenBucket(30, 30)
 
 
 # =============================
@@ -317,28 +333,19 @@ WELCOME = (
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
-    with db() as conn:
-        conn.execute(
-            "INSERT OR IGNORE INTO users (user_id, chat_id, subscribed) VALUES (?,?,1)",
-            (user_id, chat_id),
-        )
-        conn.commit()
+    await db_execute(SQL_UPSERT_USER, (user_id, chat_id))
     await update.message.reply_text(WELCOME)
 
 
 async def cmd_subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    with db() as conn:
-        conn.execute("UPDATE users SET subscribed=1 WHERE user_id=?", (user_id,))
-        conn.commit()
+    await db_execute(SQL_SET_SUB, (1, user_id))
     await update.message.reply_text("✅ Subscribed. You'll get daily questions at 09:00.")
 
 
 async def cmd_unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    with db() as conn:
-        conn.execute("UPDATE users SET subscribed=0 WHERE user_id=?", (user_id,))
-        conn.commit()
+    await db_execute(SQL_SET_SUB, (0, user_id))
     await update.message.reply_text("🔕 Unsubscribed. Use /subscribe to rejoin.")
 
 
@@ -353,68 +360,151 @@ ANOTHER = "another_question"
 RESOURCES = "resources"
 
 
-async def send_question(chat_id: int, q: Dict[str, Any], app: Application) -> None:
-    kb = InlineKeyboardMarkup(
+def question_kb(qid: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
         [
             [
-                InlineKeyboardButton("📘 Show solution", callback_data=f"{SHOW_SOLUTION}:{q['id']}")
+                InlineKeyboardButton("📘 Show solution", callback_data=f"{SHOW_SOLUTION}:{qid}")
             ],
             [
-                InlineKeyboardButton("🎲 Another", callback_data=f"{ANOTHER}:{q['id']}")
+                InlineKeyboardButton("🎲 Another", callback_data=f"{ANOTHER}:{qid}")
             ],
             [
-                InlineKeyboardButton("🔗 Resources", callback_data=f"{RESOURCES}:{q['id']}")
+                InlineKeyboardButton("🔗 Resources", callback_data=f"{RESOURCES}:{qid}")
             ],
         ]
     )
-    header = f"*Category:* {q['category']}  ·  *Difficulty:* {q['difficulty']}\n\n"
-    await app.bot.send_message(chat_id=chat_id, text=header + q["question"], parse_mode=ParseMode.MARKDOWN, reply_markup=kb)
+
+
+def resources_kb(qid: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("📘 Show solution", callback_data=f"{SHOW_SOLUTION}:{qid}")],
+        [InlineKeyboardButton("🎲 Another", callback_data=f"{ANOTHER}:{qid}")],
+    ])
+
+
+def question_header(q: Question) -> str:
+    return f"*Category:* {q.category}  ·  *Difficulty:* {q.difficulty}\n\n"
+
+
+_CATEGORY_LINKS: Dict[str, str] = {
+    "SQL": "PostgreSQL docs: https://www.postgresql.org/docs/current/",
+    "Algorithms": "CLRS Book Notes (MIT): https://mitpress.mit.edu/9780262046305/",
+    "HTML": "MDN Web Docs: https://developer.mozilla.org/en-US/docs/Web/HTML",
+    "Python": "Python docs: https://docs.python.org/3/",
+    "CSS": "MDN CSS docs: https://developer.mozilla.org/en-US/docs/Web/CSS",
+}
+
+# QUESTIONS is static, so the full send_message/edit_message_text kwargs per
+# question id (question view, solution view, resources view), keyboards
+# included, are built once in post_init.
+_PAYLOADS: Dict[str, Dict[str, Any]] = {}
+_SOLUTION_PAYLOADS: Dict[str, Dict[str, Any]] = {}
+_RESOURCES_PAYLOADS: Dict[str, Dict[str, Any]] = {}
+
+
+def build_payloads() -> None:
+    for q in QUESTIONS:
+        qid = q.id
+        _PAYLOADS[qid] = {
+            "text": question_header(q) + q.question,
+            "parse_mode": ParseMode.MARKDOWN,
+            "reply_markup": question_kb(qid),
+        }
+        _SOLUTION_PAYLOADS[qid] = {
+            "text": q.question + "\n\n" + (q.solution or "_No solution yet._"),
+            "parse_mode": ParseMode.MARKDOWN,
+        }
+        # Stub: demonstrate API mastery by linking official docs based on category
+        _RESOURCES_PAYLOADS[qid] = {
+            "text": q.question + "\n\n" + f"Helpful resources → {_CATEGORY_LINKS.get(q.category, 'General search')}",
+            "parse_mode": ParseMode.MARKDOWN,
+            "reply_markup": resources_kb(qid),
+        }
+
+
+async def send_question(chat_id: int, q: Question, app: Application) -> None:
+    await GLOBAL_BUCKET.acquire()
+    await app.bot.send_message(chat_id=chat_id, **_PAYLOADS[q.id])
+
+
+async def send_daily_question_to_user_row(app: Application, row: sqlite3.Row, today: str) -> Optional[Tuple[str, str, int]]:
+    # Sends a user's batch from an already-fetched users row. Returns the
+    # (last_question_id, last_sent_date, user_id) update to record, if any;
+    # writing it is left to the caller so the broadcast can batch them.
+    last_date = row["last_sent_date"]
+    # אם כבר שלחנו היום – נשלח שוב את הסט (אפשר להשאיר כך או לדלג; כאן שולחים שוב לפי בקשות ידניות)
+    previous_id = row["last_question_id"] if last_date == today else None
+
+    picks = pick_questions(previous_id, int(row["daily_count"]))
+
+    # No DB work while awaiting Telegram
+    for q in picks:
+        await send_question(row["chat_id"], q, app)
+
+    if picks and last_date != today:
+        return (picks[-1].id, today, row["user_id"])
+    return None
 
 
 async def send_daily_question_to_user(app: Application, user_id: int):
-    with db() as conn:
-        row = conn.execute(
-            "SELECT chat_id, subscribed, last_question_id, last_sent_date, "
-            "COALESCE(daily_count, 1) as daily_count "
-            "FROM users WHERE user_id=?",
-            (user_id,),
-        ).fetchone()
+    row = await db_fetchone(SQL_GET_USER, (user_id,))
     if not row:
         return
-    chat_id, subscribed, last_qid, last_date, daily_count = row
-    if not subscribed:
+    if not row["subscribed"]:
         return
 
-    # אם כבר שלחנו היום – נשלח שוב את הסט (אפשר להשאיר כך או לדלג; כאן שולחים שוב לפי בקשות ידניות)
-    previous_id = last_qid if last_date == today_str() else None
-
-    sent_any = False
-    for i in range(int(daily_count)):
-        q = pick_question(previous_id)
-        previous_id = q["id"]
-        await send_question(chat_id, q, app)
-        sent_any = True
-
-    if sent_any and last_date != today_str():
-        with db() as conn:
-            conn.execute(
-                "UPDATE users SET last_question_id=?, last_sent_date=? WHERE user_id=?",
-                (previous_id, today_str(), user_id),
-            )
-            conn.commit()
+    update = await send_daily_question_to_user_row(app, row, today_str())
+    if update:
+        await db_execute(SQL_SET_LAST_SENT, update)
+
+
+# Upper bound on in-flight broadcast sends (Telegram allows ~30 msg/s globally)
+BROADCAST_CONCURRENCY = 25
 
 
 async def daily_broadcast(app: Application):
-    # Send to all subscribed users
-    with db() as conn:
-        rows = conn.execute(
-            "SELECT user_id FROM users WHERE subscribed=1"
-        ).fetchall()
-    for (user_id,) in rows:
-        try:
-            await send_daily_question_to_user(app, user_id)
-        except Exception as e:
-            print(f"Failed to send to {user_id}: {e}")
+    # Send to all subscribed users: one SELECT for every subscriber's state,
+    # concurrent sends, then all bookkeeping UPDATEs in a single transaction.
+    # Users who already got today's batch (e.g. via /today) are skipped.
+    today = today_str()
+    rows = await db_fetchall(SQL_DUE_SUBSCRIBERS, (today,))
+
+    sem = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+    async def one(row):
+        async with sem:
+            try:
+                return await send_daily_question_to_user_row(app, row, today)
+            except Exception:
+                logger.exception("send failed user=%s", row["user_id"])
+                return None
+
+    results = await asyncio.gather(*(one(r) for r in rows))
+    updates = [u for u in results if u]
+
+    if updates:
+        await db_executemany(SQL_SET_LAST_SENT, updates)
+
+
+# Last payload shown per (chat_id, message_id), bounded. Editing a message to
+# what it already shows (e.g. a double-tapped button) only earns a
+# "message is not modified" error after a round-trip.
+_LAST_EDIT: "OrderedDict[Tuple[int, int], Dict[str, Any]]" = OrderedDict()
+_LAST_EDIT_MAX = 1024
+
+
+async def edit_to(query, payload: Dict[str, Any]) -> None:
+    msg = query.message
+    key = (msg.chat_id, msg.message_id) if msg is not None else None
+    if key is not None and _LAST_EDIT.get(key) is payload:
+        return
+    await query.edit_message_text(**payload)
+    if key is not None:
+        _LAST_EDIT[key] = payload
+        _LAST_EDIT.move_to_end(key)
+        if len(_LAST_EDIT) > _LAST_EDIT_MAX:
+            _LAST_EDIT.popitem(last=False)
 
 
 async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -423,58 +513,39 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     data = query.data or ""
     action, _, qid = data.partition(":")
-    q = next((x for x in QUESTIONS if x["id"] == qid), None)
+    q = QUESTIONS_BY_ID.get(qid)
     if not q:
         await query.edit_message_text("Question not found.")
         return
 
     if action == SHOW_SOLUTION:
-        await query.edit_message_text(
-            text=q["question"] + "\n\n" + q["solution"], parse_mode=ParseMode.MARKDOWN
-        )
+        payload = _SOLUTION_PAYLOADS[q.id]
     elif action == ANOTHER:
         nxt = pick_question(previous_id=qid)
-        await query.edit_message_text(
-            text=f"*Category:* {nxt['category']}  ·  *Difficulty:* {nxt['difficulty']}\n\n" + nxt["question"],
-            parse_mode=ParseMode.MARKDOWN,
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("📘 Show solution", callback_data=f"{SHOW_SOLUTION}:{nxt['id']}")],
-                [InlineKeyboardButton("🎲 Another", callback_data=f"{ANOTHER}:{nxt['id']}")],
-                [InlineKeyboardButton("🔗 Resources", callback_data=f"{RESOURCES}:{nxt['id']}")],
-            ]),
-        )
+        payload = _PAYLOADS[nxt.id]
     elif action == RESOURCES:
-        # Stub: demonstrate API mastery by linking official docs based on category
-        links = {
-            "SQL": "PostgreSQL docs: https://www.postgresql.org/docs/current/",
-            "Algorithms": "CLRS Book Notes (MIT): https://mitpress.mit.edu/9780262046305/",
-            "HTML": "MDN Web Docs: https://developer.mozilla.org/en-US/docs/Web/HTML",
-        }
-        await query.edit_message_text(
-            text=q["question"] + "\n\n" + f"Helpful resources → {links.get(q['category'], 'General search')}",
-            parse_mode=ParseMode.MARKDOWN,
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("📘 Show solution", callback_data=f"{SHOW_SOLUTION}:{q['id']}")],
-                [InlineKeyboardButton("🎲 Another", callback_data=f"{ANOTHER}:{q['id']}")],
-            ]),
-        )
+        payload = _RESOURCES_PAYLOADS[q.id]
+    else:
+        return
+    await edit_to(query, payload)
 
 
 # =============================
 # Scheduler bootstrap
 # =============================
 
-def schedule_daily(app: Application) -> BackgroundScheduler:
-    sched = BackgroundScheduler(timezone=TIMEZONE)
-    trigger = CronTrigger(hour=SCHEDULE_HOUR, minute=SCHEDULE_MIN)
+async def daily_job(context: ContextTypes.DEFAULT_TYPE):
+    await daily_broadcast(context.application)
 
-    def job_wrapper():
-        # Run within asyncio loop of Application
-        app.create_task(daily_broadcast(app))
 
-    sched.add_job(job_wrapper, trigger, name="daily_broadcast")
-    sched.start()
-    return sched
+def schedule_daily(app: Application) -> None:
+    # PTB's JobQueue runs on the application's own event loop, so the job
+    # can await the broadcast directly (no extra thread, no cross-loop hop).
+    app.job_queue.run_daily(
+        daily_job,
+        time=time(hour=SCHEDULE_HOUR, minute=SCHEDULE_MIN, tzinfo=TZ),
+        name="daily_broadcast",
+    )
 
 
 # =============================
@@ -482,7 +553,13 @@ def schedule_daily(app: Application) -> BackgroundScheduler:
 # =============================
 async def post_init(app: Application):
     # Fire once on boot to ensure DB exists
-    init_db()
+    await asyncio.to_thread(init_db)
+    build_payloads()
+
+
+async def post_shutdown(app: Application):
+    # _DB_LOCK may be held by a worker thread; don't block the loop on it
+    await asyncio.to_thread(close_db)
 
 
 async def cmd_setcount(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -498,9 +575,7 @@ async def cmd_setcount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not (1 <= n <= 5):
         await update.message.reply_text("Allowed range is 1–5.")
         return
-    with db() as conn:
-        conn.execute("UPDATE users SET daily_count=? WHERE user_id=?", (n, user_id))
-        conn.commit()
+    await db_execute(SQL_SET_COUNT, (n, user_id))
     await update.message.reply_text(f"✅ Daily question count set to {n}.")
 
 async def cmd_more(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -514,10 +589,7 @@ async def cmd_more(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pass
     # שולחים n שאלות מיידית
     app = context.application
-    previous = None
-    for _ in range(n):
-        q = pick_question(previous)
-        previous = q["id"]
+    for q in pick_questions(None, n):
         await send_question(update.effective_chat.id, q, app)
 
 
@@ -527,7 +599,18 @@ def build_app() -> Application:
     if not TELEGRAM_TOKEN:
         raise SystemExit("Missing TELEGRAM_TOKEN env var")
 
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).post_init(post_init).build()
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        # HTTP/2 multiplexes the concurrent broadcast sends over one TLS
+        # connection to api.telegram.org. getUpdates stays on HTTP/1.1: h2
+        # cancelling keepalive connections breaks long polling (PTB #3556).
+        .http_version("2")
+        .pool_timeout(30.0)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Commands
     app.add_handler(CommandHandler("start", cmd_start))
@@ -541,27 +624,32 @@ def build_app() -> Application:
     # Buttons
     app.add_handler(CallbackQueryHandler(on_button))
 
+    # Daily scheduler
+    schedule_daily(app)
+
     return app
 
 
 if __name__ == "__main__":
+    log_listener = setup_logging()
     application = build_app()
 
-    # Start daily scheduler
-    schedule_daily(application)
-
-    if WEBHOOK_URL:
-        # Webhook mode (requires a public HTTPS endpoint)
-        print(f"Starting webhook at {WEBAPP_HOST}:{WEBAPP_PORT} -> {WEBHOOK_URL}")
-        application.run_webhook(
-            listen=WEBAPP_HOST,
-            port=WEBAPP_PORT,
-            webhook_url=WEBHOOK_URL,
-        )
-    else:
-        # Long-polling mode (easy local dev)
-        print("Starting long polling…")
-        application.run_polling(close_loop=False)
+    try:
+        if WEBHOOK_URL:
+            # Webhook mode (requires a public HTTPS endpoint)
+            logger.info("Starting webhook at %s:%s -> %s", WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_URL)
+            application.run_webhook(
+                listen=WEBAPP_HOST,
+                port=WEBAPP_PORT,
+                webhook_url=WEBHOOK_URL,
+            )
+        else:
+            # Long-polling mode (easy local dev)
+            logger.info("Starting long polling…")
+            application.run_polling(close_loop=False)
+    finally:
+        # Flush whatever is still queued
+        log_listener.stop()
 
 
 
@@ -0,0 +1,58 @@
+
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+from sys import intern
+from typing import List, Dict
+
+import orjson
+
+# =============================
+# Sample Questions
+# =============================
+# The bank lives in questions.json (already dedented/stripped, so nothing is
+# reformatted at import). Point QUESTIONS_PATH elsewhere to use your own.
+QUESTIONS_PATH = os.environ.get(
+    "QUESTIONS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.json")
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Question:
+    id: str
+    category: str
+    difficulty: str
+    question: str
+    solution: str
+
+
+def load_questions(path: str = QUESTIONS_PATH) -> List[Question]:
+    # Each item must have:
+    # id, category in {"SQL","Algorithms","HTML"}, question, solution (markdown), difficulty
+    with open(path, "rb") as f:
+        raw = orjson.loads(f.read())
+    # Ids are normalized to str (callback_data hands the id back as a string);
+    # category/difficulty repeat a lot, so intern them.
+    questions = [
+        Question(
+            id=str(d["id"]),
+            category=intern(d["category"]),
+            difficulty=intern(d["difficulty"]),
+            question=d["question"],
+            solution=d.get("solution", ""),
+        )
+        for d in raw
+    ]
+    # 101 and "101" collapse to the same id, and QUESTIONS_BY_ID would keep
+    # only one of them, so reject the bank up front.
+    seen = set()
+    for q in questions:
+        if q.id in seen:
+            raise ValueError(f"duplicate question id {q.id!r} in {path}")
+        seen.add(q.id)
+    return questions
+
+
+QUESTIONS: List[Question] = load_questions()
+
+QUESTIONS_BY_ID: Dict[str, Question] = {q.id: q for q in QUESTIONS}